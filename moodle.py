@@ -12,31 +12,210 @@ FEATURES:
     * Command-Line Interface: Configure paths, files, and delimiters via flags.
     * Smart CSV Parsing: Auto-detects delimiters (comma vs semicolon) and 
       identifies columns by header names (supports English and French Moodle exports).
-    * 100MB Batching: Automatically splits files into numbered folders if the 
-      total size exceeds 100MB to prevent upload failures.
-    * Automatic Compression: Zips each folder batch once it reaches the size 
-      limit or completion.
+    * 100MB Batching: Automatically splits files into numbered zip archives if
+      the total size exceeds 100MB to prevent upload failures. Tunable via
+      --max-batch-mb; 0 writes everything into a single ZIP64 archive.
+    * Direct Zip Writing: Files are streamed straight into the zip archives
+      (uncompressed, since PDFs are already compressed) without staging copies.
     * Fuzzy Matching: Matches files to students by the student's last name.
 
 HOW IT WORKS:
     1. Scan: Iterates through the provided source directory to index graded files.
     2. Parse: Reads the student CSV, identifying "Full Name" and "Identifier" columns.
-    3. Match: For each student in the CSV, it looks for a file starting with their 
+    3. Match: For each student in the CSV, it looks for a file starting with their
        last name (case-insensitive).
-    4. Batch: Copies the file to a batch folder while tracking the total folder size.
-    5. Zip: Once a folder nears 100MB or the list ends, the folder is compressed 
-       into a .zip archive.
+    4. Batch: Writes the file into the current zip archive while tracking its
+       total size.
+    5. Rollover: Once an archive nears 100MB, it is closed and a new numbered
+       archive is started.
 """
 
 import argparse
 import csv
-import re
+import math
+import os
+import queue
 import shutil
+import threading
+import zipfile
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 # Constants
 MAX_BATCH_SIZE_MB = 100
 MAX_BATCH_SIZE_BYTES = MAX_BATCH_SIZE_MB * 1024 * 1024
+COPY_BUFFER_SIZE = 4 * 1024 * 1024
+
+# Deletes every non-digit Latin-1 character; str.translate with a prebuilt
+# table runs in C, far cheaper than a regex findall+join per CSV row.
+_NON_DIGITS = {ord(c): None for c in map(chr, range(256)) if not c.isdigit()}
+
+def entry_compression(compression, sample):
+    """Picks the compress type for one entry, given its leading bytes.
+
+    Deflate is downgraded to stored when the sample's byte entropy exceeds
+    7.5 bits/byte: already-compressed content (PDF/JPEG streams) sits near
+    8 and would only burn CPU in zlib for no savings.
+    """
+    if compression == zipfile.ZIP_DEFLATED and sample:
+        total = len(sample)
+        entropy = -sum(count / total * math.log2(count / total)
+                       for count in Counter(sample).values())
+        if entropy > 7.5:
+            return zipfile.ZIP_STORED
+    return compression
+
+def add_file_to_zip(zf, source_file, arcname, compression=zipfile.ZIP_STORED):
+    """Streams a file into the zip with a large buffer to minimize syscalls."""
+    zinfo = zipfile.ZipInfo(arcname)
+    with open(source_file, 'rb', buffering=0) as src:
+        zinfo.compress_type = entry_compression(compression, src.read(512))
+        src.seek(0)
+        if hasattr(os, 'posix_fadvise'):
+            # Hint the kernel that we read the file once, front to back
+            os.posix_fadvise(src.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        with zf.open(zinfo, 'w') as dst:
+            shutil.copyfileobj(src, dst, length=COPY_BUFFER_SIZE)
+
+def fast_copy(source_file, dest_file):
+    """Copies a file through in-kernel paths where available.
+
+    Tries os.copy_file_range first (a free copy-on-write reflink on
+    btrfs/XFS/APFS, an in-kernel copy elsewhere), then os.sendfile, and
+    finishes any remainder with a buffered userspace copy. Avoids pushing
+    every byte through Python buffers the way shutil.copyfile does.
+    """
+    with open(source_file, 'rb') as src, open(dest_file, 'wb') as dst:
+        in_fd, out_fd = src.fileno(), dst.fileno()
+        size = os.fstat(in_fd).st_size
+        offset = 0
+        if hasattr(os, 'copy_file_range'):
+            try:
+                while offset < size:
+                    copied = os.copy_file_range(in_fd, out_fd, size - offset,
+                                                offset, offset)
+                    if copied == 0:
+                        break
+                    offset += copied
+            except OSError:
+                pass  # e.g. cross-device on an older kernel; fall through
+        if offset < size and hasattr(os, 'sendfile'):
+            try:
+                dst.seek(offset)
+                while offset < size:
+                    sent = os.sendfile(out_fd, in_fd, offset, size - offset)
+                    if sent == 0:
+                        break
+                    offset += sent
+            except OSError:
+                pass
+        if offset < size:
+            src.seek(offset)
+            dst.seek(offset)
+            shutil.copyfileobj(src, dst, length=COPY_BUFFER_SIZE)
+
+def write_batches(matches, dest_base, workers, compression=zipfile.ZIP_STORED,
+                  keep_files=False, max_batch_bytes=MAX_BATCH_SIZE_BYTES):
+    """Writes matched files into numbered zip archives, splitting at
+    max_batch_bytes (0 means no splitting: one archive, one sequential pass).
+
+    Three stages overlap: the caller's match generator feeds this thread,
+    a thread pool reads source files, and a dedicated writer thread owns the
+    archive and appends entries in order. A bounded queue between producer
+    and writer (plus the bounded pending deque, roughly two files per worker)
+    caps memory, so wall time approaches the slowest stage instead of their
+    sum.
+
+    With keep_files, the renamed files are also copied (via fast_copy) into a
+    folder per batch, next to its archive.
+
+    Returns (number of batches, number of files written).
+    """
+    batch_number = 1
+    current_batch_size = 0
+    file_count = 0
+    # Deflate level 1 is ~3x faster than the default 6 for a few percent
+    # larger output; a no-op for stored archives
+    compresslevel = 1 if compression == zipfile.ZIP_DEFLATED else None
+    zf = zipfile.ZipFile(f"{dest_base}_{batch_number}.zip", 'w',
+                         compression=compression, compresslevel=compresslevel,
+                         allowZip64=True)
+    if keep_files:
+        Path(f"{dest_base}_{batch_number}").mkdir(parents=True, exist_ok=True)
+    print(f"Initial Batch Archive: {dest_base}_{batch_number}.zip")
+
+    entry_queue = queue.Queue(maxsize=16)
+    writer_error = []
+
+    def writer():
+        nonlocal zf, batch_number, current_batch_size, file_count
+        try:
+            while True:
+                entry = entry_queue.get()
+                if entry is None:
+                    break
+                source_file, arcname, file_size, data = entry
+
+                # Check if this file pushes the current batch over the limit
+                if max_batch_bytes and current_batch_size + file_size > max_batch_bytes:
+                    print(f"Batch {batch_number} full (~{current_batch_size/1e6:.1f}MB). Starting next archive...")
+                    zf.close()
+
+                    # Set up new batch
+                    batch_number += 1
+                    current_batch_size = 0
+                    zf = zipfile.ZipFile(f"{dest_base}_{batch_number}.zip", 'w',
+                                         compression=compression,
+                                         compresslevel=compresslevel,
+                                         allowZip64=True)
+                    if keep_files:
+                        Path(f"{dest_base}_{batch_number}").mkdir(parents=True, exist_ok=True)
+
+                if data is None:
+                    add_file_to_zip(zf, source_file, arcname, compression)
+                else:
+                    zinfo = zipfile.ZipInfo(arcname)
+                    zinfo.compress_type = entry_compression(compression, data[:512])
+                    zf.writestr(zinfo, data)
+                if keep_files:
+                    fast_copy(source_file, Path(f"{dest_base}_{batch_number}") / arcname)
+                current_batch_size += file_size
+                file_count += 1
+        except BaseException as e:
+            writer_error.append(e)
+            # Keep draining so the producer's bounded put() never deadlocks
+            while entry_queue.get() is not None:
+                pass
+
+    writer_thread = threading.Thread(target=writer)
+    writer_thread.start()
+
+    try:
+        if workers <= 1:
+            for source_file, arcname, file_size in matches:
+                entry_queue.put((source_file, arcname, file_size, None))
+        else:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                pending = deque()
+                for source_file, arcname, file_size in matches:
+                    while len(pending) >= 2 * workers:
+                        queued, future = pending.popleft()
+                        entry_queue.put(queued + (future.result(),))
+                    pending.append(((source_file, arcname, file_size),
+                                    executor.submit(source_file.read_bytes)))
+                while pending:
+                    queued, future = pending.popleft()
+                    entry_queue.put(queued + (future.result(),))
+    finally:
+        entry_queue.put(None)
+        writer_thread.join()
+    if writer_error:
+        raise writer_error[0]
+
+    print(f"Finalizing last batch ({batch_number})...")
+    zf.close()
+    return batch_number, file_count
 
 def get_args():
     """Configures and parses command line arguments."""
@@ -47,18 +226,86 @@ def get_args():
     parser.add_argument("-d", "--dest", default="moodle", help="Destination base name (default: 'moodle')")
     parser.add_argument("-f", "--file", required=True, dest="grp_file", help="CSV file with student info")
     parser.add_argument(
-        "-t", "--delimiter", 
-        default=None, 
+        "-t", "--delimiter",
+        default=None,
         help="CSV delimiter (e.g., ',' or ';'). If omitted, it tries to auto-detect."
     )
+    parser.add_argument(
+        "-w", "--workers",
+        type=int,
+        default=8,
+        help="Parallel reader threads (default: 8). Use 1 for mechanical disks."
+    )
+    parser.add_argument(
+        "-c", "--compression",
+        choices=["stored", "deflate"],
+        default="stored",
+        help="Zip compression (default: 'stored'; PDFs are already compressed, "
+             "use 'deflate' for text-heavy submissions)."
+    )
+    parser.add_argument(
+        "-m", "--max-batch-mb",
+        type=int,
+        default=MAX_BATCH_SIZE_MB,
+        help=f"Batch size limit in MB (default: {MAX_BATCH_SIZE_MB}). "
+             "0 disables batching and writes a single archive."
+    )
+    parser.add_argument(
+        "-k", "--keep-files",
+        action="store_true",
+        help="Also keep the renamed files in an unzipped folder per batch."
+    )
     return parser.parse_args()
 
-def search_file(starting_string, file_list):
+def detect_delimiter(sample):
+    """Picks the CSV delimiter by counting candidates on each sample line.
+
+    A real delimiter appears a consistent, non-zero number of times on every
+    row, so the candidate with a non-zero median count and the lowest
+    per-line variance wins. Runs in O(len(sample)) with no regex, unlike
+    csv.Sniffer which is slow and has pathological backtracking cases.
+    """
+    lines = [line for line in sample.splitlines() if line]
+    best, best_variance = ',', None
+    for candidate in (';', ',', '\t', '|'):
+        counts = sorted(line.count(candidate) for line in lines)
+        if not counts or counts[len(counts) // 2] == 0:
+            continue
+        mean = sum(counts) / len(counts)
+        variance = sum((c - mean) ** 2 for c in counts) / len(counts)
+        if best_variance is None or variance < best_variance:
+            best, best_variance = candidate, variance
+    return best
+
+def _alpha_prefix(s):
+    """Returns the leading alphabetic run of an already-lowercased string."""
+    for i, c in enumerate(s):
+        if not c.isalpha():
+            return s[:i]
+    return s
+
+def build_match_index(filenames):
+    """Maps each file's lowercase leading-alpha prefix to its candidates.
+
+    Filenames start with the student's last name followed by a separator, so
+    keying files and search terms by the same alpha prefix makes each student
+    lookup a dict hit instead of a scan. Only each small candidate bucket is
+    sorted (keeping deterministic first-match-wins order); no sorted copy of
+    the whole directory listing is ever materialized.
+    """
+    match_index = {}
+    for name in filenames:
+        match_index.setdefault(_alpha_prefix(name.lower()), []).append(name)
+    for candidates in match_index.values():
+        candidates.sort(key=str.lower)
+    return match_index
+
+def search_file(last_name, match_index):
     """Finds the first file that starts with the last name (case-insensitive)."""
-    search_term = starting_string.lower().strip()
-    for f in file_list:
-        if f.lower().startswith(search_term):
-            return f
+    search_term = last_name.lower()
+    for candidate in match_index.get(_alpha_prefix(search_term), ()):
+        if candidate.lower().startswith(search_term):
+            return candidate
     return None
 
 def main():
@@ -71,18 +318,15 @@ def main():
         print(f"Error: Path '{source_dir}' or file '{csv_path}' not found.")
         return
 
-    # Get sorted file listing excluding hidden files
-    files = sorted([f.name for f in source_dir.iterdir() if f.is_file() and not f.name.startswith('.')])
-
-    batch_number = 1
-    current_batch_size = 0
-    file_counter = 0
-    
-    current_dest_dir = Path(f"{dest_base}_{batch_number}")
-    current_dest_dir.mkdir(parents=True, exist_ok=True)
+    # Index files once with os.scandir, which yields name, type and size in a
+    # single directory entry (no extra stat round-trip per match later).
+    # Hidden files are excluded.
+    with os.scandir(source_dir) as it:
+        sizes = {e.name: e.stat().st_size for e in it
+                 if e.is_file(follow_symlinks=False) and not e.name.startswith('.')}
+    match_index = build_match_index(sizes)
 
     print(f"--- Starting Processing ---")
-    print(f"Initial Batch Folder: {current_dest_dir}")
 
     try:
         with open(csv_path, mode='r', encoding='utf-8-sig') as f:
@@ -90,63 +334,60 @@ def main():
             if args.delimiter:
                 dialect_char = args.delimiter
             else:
-                sample = f.read(2048)
+                sample = f.read(8192)
                 f.seek(0)
-                dialect_char = csv.Sniffer().sniff(sample).delimiter
+                dialect_char = detect_delimiter(sample)
                 print(f"Auto-detected CSV delimiter: '{dialect_char}'")
 
-            reader = csv.DictReader(f, delimiter=dialect_char)
-            
-            # Find column names dynamically (handles various Moodle export languages)
-            headers = reader.fieldnames
-            name_col = next((h for h in headers if h.lower() in ["nom complet", "full name", "name"]), None)
-            id_col = next((h for h in headers if h.lower() in ["identifiant", "identifier", "id number", "id"]), headers[0])
+            reader = csv.reader(f, delimiter=dialect_char)
 
-            if not name_col:
+            # Find column positions dynamically (handles various Moodle export languages)
+            headers = next(reader, [])
+            name_idx = next((i for i, h in enumerate(headers)
+                             if h.lower() in ["nom complet", "full name", "name"]), None)
+            id_idx = next((i for i, h in enumerate(headers)
+                           if h.lower() in ["identifiant", "identifier", "id number", "id"]), 0)
+
+            if name_idx is None:
                 print(f"Error: No 'Name' column found. Headers are: {headers}")
                 return
 
+            # Parse stage: derive all student tuples up front. csv.reader yields
+            # plain lists from its C implementation, skipping the per-row dict
+            # construction and string-keyed lookups of DictReader.
+            students = []
             for row in reader:
-                if not row.get(name_col): continue
-
-                # Clean up student info
-                moodle_number = "".join(re.findall(r'\d+', row[id_col]))
-                full_name = row[name_col].strip()
-                last_name = full_name.split(" ")[0].replace('"', '')
+                if len(row) <= name_idx or not row[name_idx]: continue
+                full_name = row[name_idx].strip()
+                students.append((full_name,
+                                 full_name.split(" ")[0].replace('"', ''),
+                                 row[id_idx].translate(_NON_DIGITS)))
 
-                original_filename = search_file(last_name, files)
+        # Match stage: pair each student with a graded file. A generator lets
+        # matching overlap with the read/write stages in write_batches.
+        def iter_matches():
+            for full_name, last_name, moodle_number in students:
+                original_filename = search_file(last_name, match_index)
 
                 if original_filename:
                     source_file = source_dir / original_filename
-                    file_size = source_file.stat().st_size
-
-                    # Check if this file pushes the current batch over 100MB
-                    if current_batch_size + file_size > MAX_BATCH_SIZE_BYTES:
-                        print(f"Batch {batch_number} full (~{current_batch_size/1e6:.1f}MB). Zipping...")
-                        shutil.make_archive(str(current_dest_dir), 'zip', current_dest_dir)
-                        
-                        # Set up new batch
-                        batch_number += 1
-                        current_batch_size = 0
-                        current_dest_dir = Path(f"{dest_base}_{batch_number}")
-                        current_dest_dir.mkdir(parents=True, exist_ok=True)
+                    file_size = sizes[original_filename]
 
                     # Create Moodle-compliant filename
                     moodle_filename = f"{full_name}_{moodle_number}_assignsubmission_file_{original_filename}"
-                    shutil.copyfile(source_file, current_dest_dir / moodle_filename)
-                    
-                    current_batch_size += file_size
-                    file_counter += 1
+                    yield source_file, moodle_filename, file_size
                 else:
                     print(f"  [MISSING] No local file found for student: {full_name}")
 
-        # Final Zip for the remaining batch
-        if any(current_dest_dir.iterdir()):
-            print(f"Finalizing last batch ({batch_number})...")
-            shutil.make_archive(str(current_dest_dir), 'zip', current_dest_dir)
+        compression = (zipfile.ZIP_STORED if args.compression == "stored"
+                       else zipfile.ZIP_DEFLATED)
+        batch_number, file_count = write_batches(
+            iter_matches(), dest_base, args.workers, compression,
+            keep_files=args.keep_files,
+            max_batch_bytes=args.max_batch_mb * 1024 * 1024)
 
         print("-" * 35)
-        print(f"SUCCESS: {file_counter} files processed.")
+        print(f"SUCCESS: {file_count} files processed.")
         print(f"OUTPUT: {batch_number} zip file(s) created.")
 
     except Exception as e:
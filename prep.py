@@ -3,153 +3,209 @@
 
 import string
 import argparse
+import copy
+import csv
 import os  # Added to handle directory creation
 from os import listdir, rename
 import shutil
+from concurrent.futures import ProcessPoolExecutor
 from os.path import isfile, join
-from PyPDF2 import PdfReader, PdfWriter
+import pikepdf
 import unicodedata
 
+# Accent-stripping table for the Latin-1 Supplement through Latin Extended-B
+# blocks, precomputed so the hot path is one C-level str.translate call
+_ACCENT_MAP = {}
+for _code in range(0x0080, 0x0250):
+  _stripped = ''.join(c for c in unicodedata.normalize('NFD', chr(_code))
+                      if unicodedata.category(c) != 'Mn')
+  if _stripped != chr(_code):
+    _ACCENT_MAP[_code] = _stripped
+
 def strip_accents(s):
+   s = s.translate(_ACCENT_MAP)
+   if s.isascii() or max(map(ord, s)) < 0x0250:
+      return s
+   # Rare codepoints outside the table take the general NFD path
    return ''.join(c for c in unicodedata.normalize('NFD', s)
                   if unicodedata.category(c) != 'Mn')
 
+def is_landscape(input_file):
+  """
+  Checks whether a scan needs splitting by reading only page geometry.
+
+  pikepdf opens lazily, so portrait A4 files are rejected without ever
+  touching their content streams.
+
+  Args:
+      input_file (str): Path to the PDF file to probe.
+  """
+  with pikepdf.open(input_file) as pdf:
+    mediabox = pdf.pages[1].mediabox
+    return float(mediabox[2]) >= float(mediabox[3])
+
 def split_exam(input_file, output_file):
   """
   Splits an A3 landscape PDF file into A4 portrait pages.
 
+  The caller is expected to have verified is_landscape() first.
+
   Args:
       input_file (str): Path to the input PDF file.
       output_file (str): Path to the output PDF file.
   """
-  with open(input_file, 'rb') as f:
-    reader = PdfReader(f)
-    writer = PdfWriter()
-
-    first_page = reader.pages[1]
-    # Get page dimensions and check if landscape
-    width, height = first_page.mediabox.upper_right
-    if width < height:
-      # Not landscape, leaving the file alone
-      return 0
-
-
-    # Read odd pages
-    for index in range(0,int(len(reader.pages)/2)):
-      page_front = reader.pages[2*index]
-      page_back = reader.pages[(2*index)+1]
-
-      # Split A3 page vertically into two halves (assuming landscape orientation)
-      half_width = width / 2
+  with pikepdf.open(input_file) as pdf:
+    first_page = pdf.pages[1]
+    # Get page dimensions
+    width = float(first_page.mediabox[2])
+    height = float(first_page.mediabox[3])
+
+    # pikepdf wraps libqpdf, so mediabox edits never reparse or rewrite the
+    # scanned image streams the way a pure-Python writer does
+    writer = pikepdf.new()
+
+    # Split A3 pages vertically into two halves (assuming landscape orientation)
+    half_width = width / 2
+
+    # The two crop boxes: (1/4, 3/4) show the right half, (2/4, 4/4) the left
+    right_half = (half_width, 0, width, height)
+    left_half = (0, 0, half_width, height)
+
+    # Walk the pages pairwise (front side, back side) in one sequential pass
+    # instead of random-access indexing into the page tree
+    for page_front, page_back in zip(pdf.pages[0::2], pdf.pages[1::2]):
+
+      # Copy each source page into the writer once; the four output pages are
+      # shallow copies sharing the same /Contents and /Resources by reference,
+      # differing only in /MediaBox. The scanned image streams are therefore
+      # serialized once instead of four times.
+      front = writer.copy_foreign(page_front.obj)
+      back = writer.copy_foreign(page_back.obj)
+
+      for source, box in ((front, right_half), (back, left_half),
+                          (back, right_half), (front, left_half)):
+        view = copy.copy(source)
+        view.MediaBox = pikepdf.Array(box)
+        writer.pages.append(pikepdf.Page(view))
+
+    writer.save(output_file, linearize=False,
+                object_stream_mode=pikepdf.ObjectStreamMode.generate)
+
+def prepare_exam(task):
+  """
+  Prepares one exam file: splits it if landscape, copies it as-is otherwise.
 
-      # Page 1/4
-      page_front.mediabox.lower_left = (half_width, 0)
-      page_front.mediabox.upper_right = (width, height)
-      writer.add_page(page_front)
+  Runs in a worker process; returns the log line so the parent can print
+  results in roster order.
+  """
+  source_exam_file, dest_exam_file, last_name, first_name = task
+  if is_landscape(source_exam_file):
+    split_exam(source_exam_file, dest_exam_file)
+  else:
+    # Not landscape, leaving the file alone
+    shutil.copyfile(source_exam_file, dest_exam_file)
+  return "Working on: " + last_name + ", " + first_name
 
-      # Page 2/4
-      page_back.mediabox.lower_left = (0, 0)
-      page_back.mediabox.upper_right = (half_width, height)
-      writer.add_page(page_back)
+# ---------------------------------------------------------
+# Command Line Argument Parsing
+# ---------------------------------------------------------
+def main():
+  parser = argparse.ArgumentParser(description="Prepare and rename exam files from scans based on a class CSV list.")
+
+  # Obligatory argument: CSV Group File
+  parser.add_argument(
+      '--group', '-g',
+      required=True,
+      help='Path to the CSV file containing student names (e.g., ../g62.csv)'
+  )
+
+  # Optional argument: Source Path (Default: scans)
+  parser.add_argument(
+      '--source', '-s',
+      default="scans",
+      help='Folder containing the source PDF scans (default: scans)'
+  )
+
+  # Optional argument: Destination Path (Default: ready_to_grade)
+  parser.add_argument(
+      '--dest', '-d',
+      default="ready_to_grade",
+      help='Folder where prepared PDFs will be saved (default: ready_to_grade)'
+  )
+
+  # Optional argument: Exclude list (Default: empty)
+  parser.add_argument(
+      '--exclude', '-e',
+      nargs='*',
+      default=[],
+      help='List of last names to exclude (e.g., -e dupont richard)'
+  )
+
+  args = parser.parse_args()
+
+  # Mapping arguments to the original variable names
+  source_path = args.source
+  dest_path = args.dest
+  grp_file = args.group
+  exclude = args.exclude
+
+  # ---------------------------------------------------------
+  # Directory Safety Check
+  # ---------------------------------------------------------
+  # Create the destination directory if it doesn't exist
+  if not os.path.exists(dest_path):
+    os.makedirs(dest_path, exist_ok=True)
+    print(f"Created destination directory: {dest_path}")
 
-      # Page 3/4
-      page_back.mediabox.lower_left = (half_width, 0)
-      page_back.mediabox.upper_right = (width, height)
-      writer.add_page(page_back)
+  # ---------------------------------------------------------
+  # Original Logic
+  # ---------------------------------------------------------
 
-      # Page 4/4
-      page_front.mediabox.lower_left = (0, 0)
-      page_front.mediabox.upper_right = (half_width, height)
-      writer.add_page(page_front)
+  # Get sorted file listing and avoid all hidden files
+  files = [f for f in listdir(source_path) if isfile(join(source_path, f)) and f[0] != '.']
+  files.sort()
 
-    with open(output_file, 'wb') as f:
-      writer.write(f)
+  file_counter = 0
 
-  return 1
+  # Collect one task per student first; splitting is CPU-bound and
+  # independent per file, so the actual work runs in parallel below
+  tasks = []
 
-# ---------------------------------------------------------
-# Command Line Argument Parsing
-# ---------------------------------------------------------
-parser = argparse.ArgumentParser(description="Prepare and rename exam files from scans based on a class CSV list.")
-
-# Obligatory argument: CSV Group File
-parser.add_argument(
-    '--group', '-g', 
-    required=True, 
-    help='Path to the CSV file containing student names (e.g., ../g62.csv)'
-)
-
-# Optional argument: Source Path (Default: scans)
-parser.add_argument(
-    '--source', '-s', 
-    default="scans", 
-    help='Folder containing the source PDF scans (default: scans)'
-)
-
-# Optional argument: Destination Path (Default: ready_to_grade)
-parser.add_argument(
-    '--dest', '-d', 
-    default="ready_to_grade", 
-    help='Folder where prepared PDFs will be saved (default: ready_to_grade)'
-)
-
-# Optional argument: Exclude list (Default: empty)
-parser.add_argument(
-    '--exclude', '-e', 
-    nargs='*', 
-    default=[], 
-    help='List of last names to exclude (e.g., -e dupont richard)'
-)
-
-args = parser.parse_args()
-
-# Mapping arguments to the original variable names
-source_path = args.source
-dest_path = args.dest
-grp_file = args.group
-exclude = args.exclude
+  # Stream the roster through the C csv parser: one pass, constant memory,
+  # and quoted fields handled correctly
+  with open(join(grp_file), newline='') as gf:
+    reader = csv.reader(gf, delimiter=';')
+    next(reader) # to skip the CSV header
 
-# ---------------------------------------------------------
-# Directory Safety Check
-# ---------------------------------------------------------
-# Create the destination directory if it doesn't exist
-if not os.path.exists(dest_path):
-    os.makedirs(dest_path, exist_ok=True)
-    print(f"Created destination directory: {dest_path}")
+    for row in reader:
 
-# ---------------------------------------------------------
-# Original Logic
-# ---------------------------------------------------------
+      students_names = row[1].split(" ")
 
-# Open the list file
-with open(join(grp_file)) as gf:
-	content = gf.readlines()[1:] # to skip the CSV header
-	content = [x.strip() for x in content]
+      # Single pass: isupper() avoids allocating an uppercased copy per token
+      upper_words, lower_words = [], []
+      for w in students_names:
+        (upper_words if w.isupper() else lower_words).append(w.lower())
 
-# Get sorted file listing and avoid all hidden files
-files = [f for f in listdir(source_path) if isfile(join(source_path, f)) and f[0] != '.']
-files.sort()
+      last_name = "-".join(upper_words)
+      first_name = "-".join(lower_words)
 
-file_counter = 0
+      last_name = strip_accents(last_name)
+      first_name = strip_accents(first_name)
 
-for i, csv in enumerate(content):
+      source_exam_file = join(source_path, files[file_counter])
+      dest_exam_file = join(dest_path, last_name+"."+first_name+'.pdf')
 
-	students_names = csv.split(";")[1].split(" ")
+      if not any(last_name in name for name in exclude):
+        tasks.append((source_exam_file, dest_exam_file, last_name, first_name))
 
-	last_name = "-".join(w.lower() for w in students_names if w.upper() == w)
-	first_name = "-".join(w.lower() for w in students_names if w.upper() != w)
-  
-	last_name = strip_accents(last_name)
-	first_name = strip_accents(first_name)
+        file_counter = file_counter+1
+      else:
+        print("  skipping: " + last_name + ", " + first_name)
 
-	source_exam_file = join(source_path, files[file_counter])
-	dest_exam_file = join(dest_path, last_name+"."+first_name+'.pdf')
+  # One worker process per core; map() yields results in roster order
+  with ProcessPoolExecutor(max_workers=os.cpu_count()) as executor:
+    for log_line in executor.map(prepare_exam, tasks):
+      print(log_line)
 
-	if not any(last_name in name for name in exclude):
-		print("Working on: " + last_name + ", " + first_name)
-		if not split_exam(source_exam_file, dest_exam_file):
-			shutil.copyfile(source_exam_file, dest_exam_file)
-		
-		file_counter = file_counter+1
-	else:
-		print("  skipping: " + last_name + ", " + first_name)
\ No newline at end of file
+if __name__ == "__main__":
+  main()
\ No newline at end of file